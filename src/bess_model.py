@@ -1,5 +1,10 @@
 import numpy as np
 import pandas as pd
+from collections import namedtuple
+
+# Snapshot of the battery state returned by BatteryEnergyStorageSystem.get_battery_state
+BatteryState = namedtuple('BatteryState', ['soc', 'existing_energy', 'total_charged',
+                                           'total_discharged', 'total_losses'])
 
 class BatteryEnergyStorageSystem:
     """
@@ -29,12 +34,14 @@ class BatteryEnergyStorageSystem:
             Maximum allowed state of charge as a fraction
         """
         # Initialize the variables
-        self.battery_capacity = battery_capacity
+        # Capacity and SOC limits live behind properties that keep the cached energy limits in sync
+        self._battery_capacity = battery_capacity
         self.battery_power = battery_power
         self.charging_efficiency = charging_efficiency
         self.discharging_efficiency = discharging_efficiency
-        self.min_soc = min_soc
-        self.max_soc = max_soc
+        self._min_soc = min_soc
+        self._max_soc = max_soc
+        self._update_limits()
 
         # Existing energy stored
         self.existing_energy = initial_soc * battery_capacity
@@ -47,6 +54,41 @@ class BatteryEnergyStorageSystem:
         self.total_discharged = 0   # Cumulative energy output from the battery
         self.total_losses = 0       # Cumulative energy lost due to inefficiencies
 
+    def _update_limits(self):
+        """
+        Cache the allowed energy range and the inverse capacity used by charge and discharge
+        """
+        self._max_energy = self._max_soc * self._battery_capacity
+        self._min_energy = self._min_soc * self._battery_capacity
+        self._inv_capacity = 1.0 / self._battery_capacity
+
+    @property
+    def battery_capacity(self):
+        return self._battery_capacity
+
+    @battery_capacity.setter
+    def battery_capacity(self, value):
+        self._battery_capacity = value
+        self._update_limits()
+
+    @property
+    def min_soc(self):
+        return self._min_soc
+
+    @min_soc.setter
+    def min_soc(self, value):
+        self._min_soc = value
+        self._update_limits()
+
+    @property
+    def max_soc(self):
+        return self._max_soc
+
+    @max_soc.setter
+    def max_soc(self, value):
+        self._max_soc = value
+        self._update_limits()
+
     def charge(self, charging_power, charging_time=1.0):
         """
         Charge the battery with the specific power for the given duration
@@ -76,19 +118,13 @@ class BatteryEnergyStorageSystem:
         # Calculate the energy that would be charged before efficiency losses
         charged_energy = actual_charging_power * charging_time
 
-        # Apply charing efficiency
-        actual_charged_energy = self.charging_efficiency * charged_energy
-
-        # Check if this would exceed the battery's capacity
-        charging_availability = self.max_soc * self.battery_capacity - self.existing_energy
-
-        if actual_charged_energy > charging_availability:
-            # Scale back the actual energy to not exceed capacity
-            actual_charged_energy = charging_availability
+        # Apply charing efficiency, scaled back to not exceed the battery's capacity
+        charging_availability = self._max_energy - self.existing_energy
+        actual_charged_energy = min(self.charging_efficiency * charged_energy, charging_availability)
         
         # Update battery state
         self.existing_energy = self.existing_energy + actual_charged_energy
-        self.soc = self.existing_energy / self.battery_capacity
+        self.soc = self.existing_energy * self._inv_capacity
 
         # Track performance metrics
         self.total_charged = self.total_charged + actual_charged_energy
@@ -119,16 +155,14 @@ class BatteryEnergyStorageSystem:
         actual_discharging_power = min(discharging_power, self.battery_power)
 
         # Calculate the amount of energy discharged
-        actual_discharged_energy = actual_discharging_power * discharging_time * self.discharging_efficiency
-
         # The discharged energy cannot be larger than the battery's energy availability
-        discharging_availability = self.existing_energy - self.min_soc * self.battery_capacity
-        if actual_discharged_energy > discharging_availability:
-            actual_discharged_energy = discharging_availability
+        discharging_availability = self.existing_energy - self._min_energy
+        actual_discharged_energy = min(actual_discharging_power * discharging_time * self.discharging_efficiency,
+                                       discharging_availability)
         
         # Update battery state
         self.existing_energy = self.existing_energy - actual_discharged_energy
-        self.soc = self.existing_energy / self.battery_capacity
+        self.soc = self.existing_energy * self._inv_capacity
 
         # Track performance metrics
         self.total_discharged = self.total_discharged + actual_discharged_energy
@@ -136,14 +170,24 @@ class BatteryEnergyStorageSystem:
 
         return actual_discharging_power, actual_discharged_energy, self.existing_energy, self.soc
     
+    def to_kernel_args(self):
+        """
+        Returns the battery parameters and current state as plain floats, in the order
+        expected by the compiled simulation kernel
+
+        Returns:
+        ------------
+        tuple : (battery_capacity, battery_power, charging_efficiency, discharging_efficiency,
+                 minimum allowed energy, maximum allowed energy, existing_energy)
+        """
+        return (float(self.battery_capacity), float(self.battery_power),
+                float(self.charging_efficiency), float(self.discharging_efficiency),
+                float(self._min_energy), float(self._max_energy),
+                float(self.existing_energy))
+
     def get_battery_state(self):
         """
-        Returns the battery state
+        Returns the battery state as a BatteryState namedtuple
         """
-        return {
-            'soc': self.soc,
-            'existing energy': self.existing_energy,
-            'total charged energy': self.total_charged,
-            'total discharged energy': self.total_discharged,
-            'total losses': self.total_losses
-        }
\ No newline at end of file
+        return BatteryState(self.soc, self.existing_energy, self.total_charged,
+                            self.total_discharged, self.total_losses)
\ No newline at end of file
@@ -1,6 +1,284 @@
 import numpy as np
 import pandas as pd
 
+try:
+    from numba import njit, prange
+    _HAVE_NUMBA = True
+except ImportError:
+    # Numba is optional, without it the kernels run as plain Python
+    _HAVE_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# Control strategies encoded as integers so that the compiled kernel can branch on them
+_STRATEGY_CODES = {'simple': 0, 'price arbitrage': 1}
+
+# Columns of the trajectory buffer written by the simulation kernel
+_TRAJECTORY_COLUMNS = ('energy_movement', 'battery_soc', 'battery_energy', 'grid_power', 'electricity_cost')
+_MOVEMENT, _SOC, _ENERGY, _GRID, _COST = range(len(_TRAJECTORY_COLUMNS))
+
+# Battery parameters expected by run_simulation_batch, one value per scenario
+_BATCH_PARAMETERS = ('battery_capacity', 'battery_power', 'initial_soc', 'charging_efficiency',
+                     'discharging_efficiency', 'min_soc', 'max_soc')
+
+
+@njit(inline='always', fastmath=True)
+def _charge_step(existing_energy, charging_power, power, eta_c, max_E):
+    """
+    One hour of charging, same rules as BatteryEnergyStorageSystem.charge
+    Returns the charged energy and the energy lost in the process
+    """
+    if charging_power < 0:
+        raise ValueError('Charging power must be positive!')
+    actual_charging_power = min(charging_power, power)
+    actual_charged_energy = min(eta_c * actual_charging_power, max_E - existing_energy)
+    return actual_charged_energy, actual_charging_power - actual_charged_energy
+
+
+@njit(inline='always', fastmath=True)
+def _discharge_step(existing_energy, discharging_power, power, eta_d, min_E):
+    """
+    One hour of discharging, same rules as BatteryEnergyStorageSystem.discharge
+    Returns the discharged energy and the energy lost in the process
+    """
+    if discharging_power < 0:
+        raise ValueError('Discharging power must be positive!')
+    actual_discharging_power = min(discharging_power, power)
+    actual_discharged_energy = min(eta_d * actual_discharging_power, existing_energy - min_E)
+    return actual_discharged_energy, actual_discharging_power * (1 - eta_d)
+
+
+@njit(cache=True, fastmath=True)
+def _simulate_into(traj, nl, ep, cap, power, eta_c, eta_d, min_E, max_E, E0,
+                   low_thr, high_thr, strategy_code):
+    """
+    Hourly simulation loop on plain arrays, the battery state is kept in local scalars
+    The battery parameters are those returned by BatteryEnergyStorageSystem.to_kernel_args
+
+    Net load, prices and the trajectory buffer are float32 to halve the memory traffic,
+    the stored energy and the cumulative totals are accumulated in float64 to avoid drift
+
+    Writes the _TRAJECTORY_COLUMNS into the caller supplied (T, 5) buffer, one row per hour
+    so that each hour's results are written contiguously, and returns the final stored energy
+    and the cumulative charged, discharged and lost energy
+    The electricity cost column is left for the caller to fill in
+    """
+    n = len(nl)
+    inv_cap = 1.0 / cap
+    E = E0
+    total_charged = 0.0
+    total_discharged = 0.0
+    total_losses = 0.0
+
+    for hour in range(n):
+        current_net_load = nl[hour]
+        current_price = ep[hour]
+
+        if strategy_code == 0:
+            if current_net_load > 0: # PV can cover building demand, charge with excess PV
+                charged, losses = _charge_step(E, current_net_load, power, eta_c, max_E)
+                E = E + charged
+                total_charged = total_charged + charged
+                total_losses = total_losses + losses
+                traj[hour, _MOVEMENT] = charged # Positive is charging
+                # If there is still excess PV generation, then export it to grid
+                traj[hour, _GRID] = current_net_load - charged
+            else: # PV cannot cover building demand, discharge the battery first
+                discharged, losses = _discharge_step(E, - current_net_load, power, eta_d, min_E)
+                E = E - discharged
+                total_discharged = total_discharged + discharged
+                total_losses = total_losses + losses
+                traj[hour, _MOVEMENT] = - discharged # Negative means discharging
+                # If battery is dificit, then import electricity from the grid
+                traj[hour, _GRID] = current_net_load + discharged
+            traj[hour, _ENERGY] = E
+            traj[hour, _SOC] = E * inv_cap
+
+        elif strategy_code == 1:
+            if current_price <= low_thr:
+                # Low price means good time to charge
+                # But still prioritize using excess PV to charge first because it's free
+                if current_net_load > 0:
+                    charging_power = current_net_load
+                else:
+                    # No excess PV but price is low, charge battery to full from the grid
+                    charging_power = power
+
+                charged, losses = _charge_step(E, charging_power, power, eta_c, max_E)
+                E = E + charged
+                total_charged = total_charged + charged
+                total_losses = total_losses + losses
+                traj[hour, _MOVEMENT] = charged # Positive is charging
+                traj[hour, _ENERGY] = E
+                traj[hour, _SOC] = E * inv_cap
+                # If there is still excess PV generation, then export it to grid
+                traj[hour, _GRID] = current_net_load - charged
+
+            elif current_price > high_thr:
+                # High price means good time to discharge
+                if current_net_load < 0:
+                    # PV not enough to cover building load therefore discharge the battery
+                    discharging_power = - current_net_load
+                elif E * inv_cap > 0.1:
+                    # PV enough to cover building load, but price is high, discharge to SOC=0.1
+                    discharging_power = power
+                else:
+                    discharging_power = 0.0
+
+                discharged, losses = _discharge_step(E, discharging_power, power, eta_d, min_E)
+                E = E - discharged
+                total_discharged = total_discharged + discharged
+                total_losses = total_losses + losses
+                traj[hour, _MOVEMENT] = - discharged # Negative is discharging
+                traj[hour, _ENERGY] = E
+                traj[hour, _SOC] = E * inv_cap
+                # If battery is dificit, then import electricity from the grid
+                traj[hour, _GRID] = current_net_load + discharged
+
+            else:
+                # Medium price, the operate normally like in 'simple' strategy
+                if current_net_load > 0:
+                    charged, losses = _charge_step(E, current_net_load, power, eta_c, max_E)
+                    E = E + charged
+                    total_charged = total_charged + charged
+                    total_losses = total_losses + losses
+                    traj[hour, _MOVEMENT] = charged # Positive is charging
+                    traj[hour, _GRID] = current_net_load - charged
+                else:
+                    discharged, losses = _discharge_step(E, - current_net_load, power, eta_d, min_E)
+                    E = E - discharged
+                    total_discharged = total_discharged + discharged
+                    total_losses = total_losses + losses
+                    traj[hour, _MOVEMENT] = - discharged # Negative means discharging
+                    traj[hour, _GRID] = current_net_load + discharged
+                traj[hour, _ENERGY] = E
+                traj[hour, _SOC] = E * inv_cap
+
+    return E, total_charged, total_discharged, total_losses
+
+
+@njit(cache=True, fastmath=True)
+def _simulate_kernel(nl, ep, cap, power, eta_c, eta_d, min_E, max_E, E0,
+                     low_thr, high_thr, strategy_code):
+    """
+    Allocate a (T, 5) trajectory buffer and run _simulate_into on it
+
+    Returns the trajectory buffer, followed by the final stored energy and the cumulative
+    charged, discharged and lost energy
+    """
+    traj = np.empty((len(nl), len(_TRAJECTORY_COLUMNS)), dtype=np.float32)
+    E, total_charged, total_discharged, total_losses = _simulate_into(
+        traj, nl, ep, cap, power, eta_c, eta_d, min_E, max_E, E0, low_thr, high_thr, strategy_code)
+    return traj, E, total_charged, total_discharged, total_losses
+
+
+@njit(cache=True, parallel=True)
+def _simulate_batch_kernel(nl, ep, cap, power, eta_c, eta_d, min_E, max_E, E0,
+                           low_thr, high_thr, strategy_code):
+    """
+    Run _simulate_into for K parameter sets in parallel, each writing straight into its slice
+    of the shared (K, T, 5) buffer
+    The hourly recurrence is sequential within a scenario but scenarios are independent
+    """
+    K = len(cap)
+    n = len(nl)
+    trajectories = np.empty((K, n, len(_TRAJECTORY_COLUMNS)), dtype=np.float32)
+    existing_energy = np.zeros(K)
+    total_charged = np.zeros(K)
+    total_discharged = np.zeros(K)
+    total_losses = np.zeros(K)
+
+    for k in prange(K):
+        (E, tc, td, tl) = _simulate_into(
+            trajectories[k], nl, ep, cap[k], power[k], eta_c[k], eta_d[k], min_E[k], max_E[k], E0[k],
+            low_thr, high_thr, strategy_code)
+        existing_energy[k] = E
+        total_charged[k] = tc
+        total_discharged[k] = td
+        total_losses[k] = tl
+
+    return trajectories, existing_energy, total_charged, total_discharged, total_losses
+
+
+def _simulate_simple_vectorized(nl, cap, power, eta_c, eta_d, min_E, max_E, E0):
+    """
+    'simple' strategy without the hourly loop, for batteries that never reach their energy limits
+    Only worth it when Numba is missing, the compiled kernel is faster than these array passes
+
+    As long as no hour is clipped by the minimum or maximum allowed energy, the stored energy
+    is the cumulative sum of the charge/discharge requests. Returns the same values as
+    _simulate_kernel, or None if the battery saturates and the kernel has to be used instead
+    """
+    if len(nl) == 0:
+        return None
+
+    # Charge with excess PV, discharge to cover the dificit, limited by the power rating
+    charge_req = np.minimum(np.maximum(nl, 0), power)
+    disch_req = np.minimum(np.maximum(-nl, 0), power)
+    delta = eta_c * charge_req - eta_d * disch_req
+
+    energy = E0 + np.cumsum(delta, dtype=np.float64)
+    if energy.max() > max_E or energy.min() < min_E:
+        return None
+
+    traj = np.empty((len(nl), len(_TRAJECTORY_COLUMNS)), dtype=np.float32)
+    traj[:, _MOVEMENT] = delta
+    traj[:, _ENERGY] = energy
+    traj[:, _SOC] = energy * (1.0 / cap)
+    traj[:, _GRID] = nl - delta
+
+    total_charged = eta_c * charge_req.sum(dtype=np.float64)
+    total_discharged = eta_d * disch_req.sum(dtype=np.float64)
+    total_losses = ((1 - eta_c) * charge_req.sum(dtype=np.float64)
+                    + (1 - eta_d) * disch_req.sum(dtype=np.float64))
+
+    return traj, energy[-1], total_charged, total_discharged, total_losses
+
+
+def _prepare_inputs(pv_generation, building_demand, electricity_prices, control_strategy):
+    """
+    Validate the inputs and convert them to NumPy arrays once
+
+    Returns the PV generation, building demand and price arrays as given, the float32
+    price and net load arrays used by the kernels, followed by the low and high price
+    thresholds used by 'price arbitrage'
+    """
+
+    # Check that all input series have the same length
+    if not (len(pv_generation) == len(building_demand) == len(electricity_prices)):
+        raise ValueError('Input data series must have the same length!')
+    if control_strategy not in _STRATEGY_CODES:
+        raise ValueError(f'Unknown control strategy: {control_strategy}')
+
+    # Work on plain NumPy arrays, pandas scalar indexing is far too slow hour by hour
+    pv_arr = pv_generation.to_numpy()
+    bd_arr = building_demand.to_numpy()
+    ep_arr = electricity_prices.to_numpy()
+
+    # The kernels run in float32, which is plenty for energy values and prices
+    ep = ep_arr.astype(np.float32)
+
+    # The difference between PV generation and building demand
+    # Subtract at the input precision and only round the result to float32, without a temporary
+    net_load = np.empty(len(pv_arr), dtype=np.float32)
+    np.subtract(pv_arr, bd_arr, out=net_load, casting='same_kind')
+
+    # Simplified price threshold logic for 'price arbitrage'
+    # In a real implementation, you would use more sophisticated logic
+    # Empty inputs have no percentiles, the kernels then simply return empty trajectories
+    if control_strategy == 'price arbitrage' and len(ep) > 0:
+        price_threshold_low = np.percentile(ep, 25)
+        price_threshold_high = np.percentile(ep, 75)
+    else:
+        price_threshold_low = price_threshold_high = 0.0
+
+    return pv_arr, bd_arr, ep_arr, ep, net_load, price_threshold_low, price_threshold_high
+
+
 def run_simulation(battery, pv_generation, building_demand, electricity_prices,
                    control_strategy='simple', grid_connection_limit=None):
     """
@@ -19,155 +297,110 @@ def run_simulation(battery, pv_generation, building_demand, electricity_prices,
     control_strategy : str
         Strategy to control bettery operation:
         - 'simple' : Charge from excess PV, discharge to meet demand
-        - 'price_arbitrage' : Also consider electricity prices for operation
+        - 'price arbitrage' : Also consider electricity prices for operation
     grid_connection_limit : float or None
         Maximum power that can be imported/exported from the grid
     """
 
-    # Check that all input series have the same length
-    if not (len(pv_generation) == len(building_demand) == len(electricity_prices)):
-        raise ValueError('Input data series must have the same length!')
-    
-    # Prepare the results DataFrame
-    results = pd.DataFrame({
-        'timestamp': pv_generation.index,
-        'pv_generation': pv_generation.values,
-        'building_demand': building_demand.values,
-        'electricity_prices': electricity_prices.values
-    })
+    pv_arr, bd_arr, ep_arr, ep, net_load, price_threshold_low, price_threshold_high = _prepare_inputs(
+        pv_generation, building_demand, electricity_prices, control_strategy)
 
-    # Arrays to store simulation results
-    # The difference between PV generation and building demand
-    net_load = pv_generation - building_demand
-    energy_movement = np.zeros(len(net_load))
-    battery_soc = np.zeros(len(net_load))
-    battery_energy = np.zeros(len(net_load))
-    grid_power = np.zeros(len(net_load))
-    electricity_cost = np.zeros(len(net_load))
-
-    # Run simulation hour by hour
-    for hour in range(len(net_load)):
-        current_net_load = net_load.iloc[hour]
-        current_price = electricity_prices.iloc[hour]
-
-        # Determine battery operation based on strategy
-        if control_strategy == 'simple':
-            if current_net_load > 0: # PV can cover building demand, excess PV generation
-                # Charge the battery with excess PV
-                charging_power = current_net_load
-                actual_charged_energy = battery.charge(charging_power)[1]
-                energy_movement[hour] = actual_charged_energy # Positive is charging
-                battery_energy[hour] = battery.get_battery_state()['existing energy']
-                battery_soc[hour] = battery.get_battery_state()['soc']
-                # If there is still excess PV generation, then export it to grid
-                remaining_PV = current_net_load - actual_charged_energy
-                grid_power[hour] = remaining_PV # Export to the grid
-                
-            else: # PV cannot cover building demand
-                  # Try to discharge battery first to cover building demand
-                discharging_power = - current_net_load # Convert it to positive values
-                actual_discharged_energy = battery.discharge(discharging_power)[1]
-                energy_movement[hour] = - actual_discharged_energy # Negative means discharging
-                battery_energy[hour] = battery.get_battery_state()['existing energy']
-                battery_soc[hour] = battery.get_battery_state()['soc']
-                # If battery is dificit, then import electricity from the grid
-                remaining_dificit = current_net_load + actual_discharged_energy
-                grid_power[hour] = remaining_dificit # Import from the grid
-        elif control_strategy == 'price arbitrage':
-            # Simplified price threshold logic
-            # In a real implementation, you would use more sophisticated logic
-            price_threshold_low = np.percentile(electricity_prices, 25)
-            price_threshold_high = np.percentile(electricity_prices, 75)
-
-            if current_price <= price_threshold_low:
-                # Low price means good time to charge
-                # But still prioritize using excess PV to charge first because it's free
-                if current_net_load > 0:
-                    # We have excess PV, use it first
-                    charging_power = current_net_load
-                else:
-                    # No excess PV but price is low, so consider charing from grid
-                    # You can choose to charge battery to full or
-                    # Only charge from grid if batttery is below 70% SOC
-                    # Here we choose to charge battery to full
-                    charging_power = battery.battery_power
-            
-                actual_charged_energy = battery.charge(charging_power)
-                energy_movement[hour] = actual_charged_energy # Positive is charging
-                battery_energy[hour] = battery.get_battery_state()['existing energy']
-                battery_soc[hour] = battery.get_battery_state()['soc']
-                # If there is still excess PV generation, then export it to grid
-                remaining_PV = current_net_load - actual_charged_energy
-                grid_power[hour] = remaining_PV # Export to the grid
+    kernel_args = battery.to_kernel_args()
+    simulated = None
+    if control_strategy == 'simple' and not _HAVE_NUMBA:
+        simulated = _simulate_simple_vectorized(net_load, *kernel_args)
+    if simulated is None:
+        # Run simulation hour by hour
+        simulated = _simulate_kernel(
+            net_load, ep, *kernel_args,
+            price_threshold_low, price_threshold_high, _STRATEGY_CODES[control_strategy])
+    (traj, existing_energy, total_charged, total_discharged, total_losses) = simulated
 
-            if current_price > price_threshold_high:
-                # High price means good time to discharge
-                if current_net_load < 0:
-                    # PV not enough to cover building load therefore discharge the battery
-                    discharging_power = - current_net_load # convert to positive value
-                else:
-                    # PV enough to cover building load, but price is high, so dicharge to the grid
-                    # You can choose to dischagre batter to SOC=0.1 or
-                    # Only discharge to grid if battery is above SOC=0.3
-                    # Here we choose to discharge batter to SOC=0.1
-                    if battery.soc > 0.1:
-                        discharging_power = battery.batter_power
-                    else:
-                        discharging_power = 0
-                
-                actual_discharged_energy = battery.discharge(discharging_power)
-                energy_movement[hour] = - actual_discharged_energy # Negative is discharging
-                battery_energy[hour] = battery.get_battery_state()['existing energy']
-                battery_soc[hour] = battery.get_battery_state()['soc']
-                # If battery is dificit, then import electricity from the grid
-                remaining_dificit = current_net_load + actual_discharged_energy
-                grid_power[hour] = remaining_dificit # Import from the grid
+    # Write the final state back to the battery
+    battery.existing_energy = existing_energy
+    battery.soc = existing_energy / battery.battery_capacity
+    battery.total_charged = battery.total_charged + total_charged
+    battery.total_discharged = battery.total_discharged + total_discharged
+    battery.total_losses = battery.total_losses + total_losses
+
+    # Apply grid connection limit if specified, exchange beyond the limit is curtailed
+    grid_power = traj[:, _GRID]
+    if grid_connection_limit is not None:
+        np.clip(grid_power, -grid_connection_limit, grid_connection_limit, out=grid_power)
+
+    # Calculate cost/revenue from electricity exchange with grid
+    np.multiply(grid_power, ep, out=traj[:, _COST])
+
+    # Assemble the results DataFrame once at the end, wrapping the existing arrays without copying them
+    # The trajectory buffer becomes a single float block, next to the input columns
+    inputs = pd.DataFrame({
+        'timestamp': pv_generation.index,
+        'pv_generation': pv_arr,
+        'building_demand': bd_arr,
+        'electricity_prices': ep_arr
+    }, copy=False)
+    results = pd.concat([inputs, pd.DataFrame(traj, columns=_TRAJECTORY_COLUMNS, copy=False)], axis=1)
 
-            else:
-                # Medium price, the operate normally like in 'simple' strategy
-                if current_net_load > 0: # PV can cover building demand, excess PV generation
-                    # Charge the battery with excess PV
-                    charging_power = current_net_load
-                    actual_charged_energy = battery.charge(charging_power)[1]
-                    energy_movement[hour] = actual_charged_energy # Positive is charging
-                    battery_energy[hour] = battery.get_battery_state()['existing energy']
-                    battery_soc[hour] = battery.get_battery_state()['soc']
-                    # If there is still excess PV generation, then export it to grid
-                    remaining_PV = current_net_load - actual_charged_energy
-                    grid_power[hour] = remaining_PV # Export to the grid
-                
-                else: # PV cannot cover building demand
-                    # Try to discharge battery first to cover building demand
-                    discharging_power = current_net_load
-                    actual_discharged_energy = battery.discharge(discharging_power)[1]
-                    energy_movement[hour] = - actual_discharged_energy # Negative means discharging
-                    battery_energy[hour] = battery.get_battery_state()['existing energy']
-                    battery_soc[hour] = battery.get_battery_state()['soc']
-                    # If battery is dificit, then import electricity from the grid
-                    remaining_dificit = current_net_load + actual_discharged_energy
-                    grid_power[hour] = remaining_dificit # Import from the grid
-
-        # Apply grid connection limit if specified
-        if grid_connection_limit is not None:
-            pass
-
-        # Calculate cost/revenue from electricity exchange with grid
-        electricity_cost[hour] = grid_power[hour] * current_price
-
-        # Store battery state
-        battery_state = battery.get_battery_state()
-    
-    # Add results to DataFrame
-    results['energy_movement'] = energy_movement
-    results['battery_soc'] = battery_soc
-    results['battery_energy'] = battery_energy
-    results['grid_power'] = grid_power
-    results['electricity_cost'] = electricity_cost
-    
     return results
 
 
+def run_simulation_batch(battery_params, pv_generation, building_demand, electricity_prices,
+                         control_strategy='simple', grid_connection_limit=None):
+    """
+    Run the simulation for K battery configurations at once, e.g. to size the battery
+
+    Parameters:
+    ------------
+    battery_params : dict
+        The BatteryEnergyStorageSystem arguments battery_capacity, battery_power, initial_soc,
+        charging_efficiency, discharging_efficiency, min_soc and max_soc, each either an array
+        of shape (K,) or a scalar shared by all scenarios
+    pv_generation : pandas.Series
+        Hourly PV generation in kW
+    building_demand: pandas.Series
+        Hourly building electricity demand in kW
+    electricity_prices : pandas.Series
+        Hourly electricity price
+    control_strategy : str
+        Strategy to control bettery operation, see run_simulation
+    grid_connection_limit : float or None
+        Maximum power that can be imported/exported from the grid
+
+    Returns:
+    ------------
+    results : dict
+        energy_movement, battery_soc, battery_energy, grid_power and electricity_cost as arrays
+        of shape (K, T), and the final existing_energy, total_charged, total_discharged and
+        total_losses as arrays of shape (K,)
+    """
+
+    missing = [name for name in _BATCH_PARAMETERS if name not in battery_params]
+    if missing:
+        raise ValueError(f'Missing battery parameters: {missing}')
+
+    # One float array of shape (K,) per parameter
+    params = np.broadcast_arrays(*[np.atleast_1d(np.asarray(battery_params[name], dtype=np.float64))
+                                   for name in _BATCH_PARAMETERS])
+    cap, power, initial_soc, eta_c, eta_d, min_soc, max_soc = [np.ascontiguousarray(p) for p in params]
 
-    
+    _, _, _, ep, net_load, price_threshold_low, price_threshold_high = _prepare_inputs(
+        pv_generation, building_demand, electricity_prices, control_strategy)
 
+    (trajectories, existing_energy, total_charged, total_discharged, total_losses) = _simulate_batch_kernel(
+        net_load, ep, cap, power, eta_c, eta_d, min_soc * cap, max_soc * cap, initial_soc * cap,
+        price_threshold_low, price_threshold_high, _STRATEGY_CODES[control_strategy])
 
+    grid_power = trajectories[:, :, _GRID]
+    if grid_connection_limit is not None:
+        np.clip(grid_power, -grid_connection_limit, grid_connection_limit, out=grid_power)
+    np.multiply(grid_power, ep, out=trajectories[:, :, _COST])
+
+    results = {name: trajectories[:, :, j] for j, name in enumerate(_TRAJECTORY_COLUMNS)}
+    results.update({
+        'existing_energy': existing_energy,
+        'total_charged': total_charged,
+        'total_discharged': total_discharged,
+        'total_losses': total_losses
+    })
+
+    return results
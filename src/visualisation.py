@@ -1,28 +1,101 @@
-def visualize_results(results):
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+import seaborn as sns
+from matplotlib.collections import LineCollection
+
+# run_simulation works in kW/kWh per hour, the figures and summaries report MW/MWh
+KW_PER_MW = 1000
+
+
+def _monthly_summary(results):
     """
-    Create visualizations of the simulation results
-    
+    Monthly energy flows and average SOC of the simulation results
+    """
+    # Split grid and battery power into their directions hour by hour, then resample once
+    # Positive grid power is export and negative is import, positive energy movement is charging
+    grid_power = results['grid_power'].to_numpy() / KW_PER_MW
+    battery_power = results['energy_movement'].to_numpy() / KW_PER_MW
+    hourly_data = pd.DataFrame({
+        'timestamp': results['timestamp'],
+        'pv_generation_mw': results['pv_generation'].to_numpy() / KW_PER_MW,
+        'building_demand_mw': results['building_demand'].to_numpy() / KW_PER_MW,
+        'grid_import_mwh': -np.minimum(grid_power, 0),
+        'grid_export_mwh': np.maximum(grid_power, 0),
+        'battery_charge_mwh': np.maximum(battery_power, 0),
+        'battery_discharge_mwh': -np.minimum(battery_power, 0),
+        'battery_soc': results['battery_soc']
+    })
+    monthly_data = hourly_data.resample('ME', on='timestamp').agg({
+        'pv_generation_mw': 'sum',
+        'building_demand_mw': 'sum',
+        'grid_import_mwh': 'sum',
+        'grid_export_mwh': 'sum',
+        'battery_charge_mwh': 'sum',
+        'battery_discharge_mwh': 'sum',
+        'battery_soc': 'mean'
+    })
+
+    return monthly_data
+
+
+def summarize(results):
+    """
+    Compute the annual summary statistics of the simulation results without plotting
+
     Parameters:
     -----------
     results : pandas.DataFrame
-        Simulation results
-            
+        Simulation results as returned by run_simulation
+
     Returns:
     --------
-    tuple : Figures for the visualizations
+    dict : Annual energy totals in MWh, the average SOC and the net electricity cost
+    """
+    # Positive grid power is export and negative is import, positive energy movement is charging
+    # The simulation returns float32 trajectories, accumulate the annual totals in float64
+    grid_power = results['grid_power'].to_numpy(dtype=np.float64)
+    battery_power = results['energy_movement'].to_numpy(dtype=np.float64)
+
+    return {
+        'total_pv_generation_mwh': results['pv_generation'].sum() / KW_PER_MW,
+        'total_building_demand_mwh': results['building_demand'].sum() / KW_PER_MW,
+        'total_grid_import_mwh': -np.minimum(grid_power, 0).sum() / KW_PER_MW,
+        'total_grid_export_mwh': np.maximum(grid_power, 0).sum() / KW_PER_MW,
+        'total_charged_mwh': np.maximum(battery_power, 0).sum() / KW_PER_MW,
+        'total_discharged_mwh': -np.minimum(battery_power, 0).sum() / KW_PER_MW,
+        'average_soc': results['battery_soc'].to_numpy(dtype=np.float64).mean(),
+        # electricity_cost is positive for revenue from export
+        'net_electricity_cost': -results['electricity_cost'].to_numpy(dtype=np.float64).sum()
+    }
+
+
+def plot_power_week(results):
+    """
+    Plot the power flows of the first week
+
+    Parameters:
+    -----------
+    results : pandas.DataFrame
+        Simulation results as returned by run_simulation
+
+    Returns:
+    --------
+    matplotlib.figure.Figure
     """
     # Set Seaborn style
     sns.set_style("whitegrid")
-    
-    # Figure 1: Power flows over time (a week)
+
     week_data = results.iloc[0:168]  # First week
     
     fig1, ax1 = plt.subplots(figsize=(14, 8))
     
-    ax1.plot(week_data['timestamp'], week_data['pv_generation_mw'], 'y-', label='PV Generation')
-    ax1.plot(week_data['timestamp'], week_data['building_demand_mw'], 'r-', label='Building Demand')
-    ax1.plot(week_data['timestamp'], week_data['battery_power_mw'], 'g-', label='Battery Power')
-    ax1.plot(week_data['timestamp'], week_data['grid_power_mw'], 'b-', label='Grid Power')
+    # Battery power is positive when charging, grid power is positive when exporting
+    ax1.plot(week_data['timestamp'], week_data['pv_generation'] / KW_PER_MW, 'y-', label='PV Generation')
+    ax1.plot(week_data['timestamp'], week_data['building_demand'] / KW_PER_MW, 'r-', label='Building Demand')
+    ax1.plot(week_data['timestamp'], week_data['energy_movement'] / KW_PER_MW, 'g-', label='Battery Power')
+    ax1.plot(week_data['timestamp'], week_data['grid_power'] / KW_PER_MW, 'b-', label='Grid Power')
     
     ax1.axhline(y=0, color='k', linestyle='-', alpha=0.2)
     ax1.set_title('Power Flows - First Week', fontsize=16)
@@ -34,8 +107,25 @@ def visualize_results(results):
     # Format x-axis dates
     ax1.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d %H'))
     fig1.autofmt_xdate()
-    
-    # Figure 2: Battery state of charge over time
+
+    return fig1
+
+
+def plot_soc(results):
+    """
+    Plot the battery state of charge over time, colored by its level
+
+    Parameters:
+    -----------
+    results : pandas.DataFrame
+        Simulation results as returned by run_simulation
+
+    Returns:
+    --------
+    matplotlib.figure.Figure
+    """
+    sns.set_style("whitegrid")
+
     fig2, ax2 = plt.subplots(figsize=(14, 8))
     
     # Create a colormap for SOC
@@ -43,10 +133,17 @@ def visualize_results(results):
     norm = plt.Normalize(vmin=0, vmax=1)
     
     # Plot battery SOC with color indicating level
-    for i in range(1, len(results)):
-        ax2.plot(results['timestamp'].iloc[i-1:i+1], 
-                 results['battery_soc'].iloc[i-1:i+1], 
-                 color=cmap(norm(results['battery_soc'].iloc[i])))
+    # One segment per hour, drawn as a single collection and colored by the SOC at its end
+    soc = results['battery_soc'].to_numpy()
+    points = np.column_stack([mdates.date2num(results['timestamp']), soc]).reshape(-1, 1, 2)
+    segments = np.concatenate([points[:-1], points[1:]], axis=1)
+    lc = LineCollection(segments, cmap=cmap, norm=norm)
+    lc.set_array(soc[1:])
+    ax2.add_collection(lc)
+    ax2.xaxis_date()
+    # Empty or single hour results have no time span to fit the x-axis to
+    if len(soc) > 1:
+        ax2.set_xlim(points[0, 0, 0], points[-1, 0, 0])
     
     ax2.set_title('Battery State of Charge (SOC)', fontsize=16)
     ax2.set_xlabel('Time', fontsize=12)
@@ -55,29 +152,38 @@ def visualize_results(results):
     ax2.set_ylim(0, 1)
     
     # Add a colorbar
-    sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
-    sm.set_array([])
-    cbar = plt.colorbar(sm, ax=ax2)
+    cbar = plt.colorbar(lc, ax=ax2)
     cbar.set_label('State of Charge', fontsize=12)
     
     # Format x-axis
     ax2.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
     fig2.autofmt_xdate()
-    
-    # Figure 3: Monthly summary
-    monthly_data = results.resample('M', on='timestamp').sum()
-    monthly_soc = results.resample('M', on='timestamp').mean()['battery_soc']
-    
+
+    return fig2
+
+
+def plot_monthly(results):
+    """
+    Plot the monthly energy flows and battery activity
+
+    Parameters:
+    -----------
+    results : pandas.DataFrame
+        Simulation results as returned by run_simulation
+
+    Returns:
+    --------
+    matplotlib.figure.Figure
+    """
+    sns.set_style("whitegrid")
+
+    monthly_data = _monthly_summary(results)
+
     fig3, (ax3a, ax3b) = plt.subplots(2, 1, figsize=(14, 12), sharex=True)
     
-    # Monthly energy flow
-    monthly_data['grid_import_mwh'] = monthly_data.loc[monthly_data['grid_power_mw'] > 0, 'grid_power_mw']
-    monthly_data['grid_export_mwh'] = -monthly_data.loc[monthly_data['grid_power_mw'] < 0, 'grid_power_mw']
-    monthly_data['battery_charge_mwh'] = monthly_data.loc[monthly_data['battery_power_mw'] > 0, 'battery_power_mw']
-    monthly_data['battery_discharge_mwh'] = -monthly_data.loc[monthly_data['battery_power_mw'] < 0, 'battery_power_mw']
-    
     # Plot monthly energy
     index = np.arange(len(monthly_data.index))
+    month_labels = monthly_data.index.strftime('%b %Y').tolist()
     bar_width = 0.35
     
     ax3a.bar(index, monthly_data['pv_generation_mw'], bar_width, label='PV Generation')
@@ -90,12 +196,12 @@ def visualize_results(results):
     ax3a.legend(fontsize=12)
     ax3a.grid(True)
     ax3a.set_xticks(index + bar_width / 2)
-    ax3a.set_xticklabels([d.strftime('%b %Y') for d in monthly_data.index], rotation=45)
+    ax3a.set_xticklabels(month_labels, rotation=45)
     
     # Plot monthly battery activity
     ax3b.bar(index, monthly_data['battery_charge_mwh'], bar_width, label='Battery Charge')
     ax3b.bar(index + bar_width, monthly_data['battery_discharge_mwh'], bar_width, label='Battery Discharge')
-    ax3b.plot(index + bar_width/2, monthly_soc.values, 'ko-', label='Average SOC')
+    ax3b.plot(index + bar_width/2, monthly_data['battery_soc'].values, 'ko-', label='Average SOC')
     
     ax3b.set_title('Monthly Battery Activity', fontsize=16)
     ax3b.set_xlabel('Month', fontsize=12)
@@ -103,22 +209,42 @@ def visualize_results(results):
     ax3b.legend(fontsize=12)
     ax3b.grid(True)
     ax3b.set_xticks(index + bar_width / 2)
-    ax3b.set_xticklabels([d.strftime('%b %Y') for d in monthly_data.index], rotation=45)
+    ax3b.set_xticklabels(month_labels, rotation=45)
     
     fig3.tight_layout()
-    
-    # Figure 4: Summary statistics
+
+    return fig3
+
+
+def plot_summary(analysis):
+    """
+    Plot the annual energy summary
+
+    Parameters:
+    -----------
+    analysis : dict
+        Summary statistics as returned by summarize, optionally completed with
+        total_losses_mwh, battery_cycles, overall_efficiency and estimated_savings
+
+    Returns:
+    --------
+    matplotlib.figure.Figure
+    """
+    sns.set_style("whitegrid")
+
     fig4, ax4 = plt.subplots(figsize=(10, 8))
     
     summary_labels = ['PV Generation', 'Building Demand', 'Grid Import', 'Grid Export', 
-                     'Battery Charge', 'Battery Discharge', 'Battery Losses']
+                     'Battery Charge', 'Battery Discharge']
     summary_values = [analysis['total_pv_generation_mwh'], 
                       analysis['total_building_demand_mwh'],
                       analysis['total_grid_import_mwh'], 
                       analysis['total_grid_export_mwh'],
                       analysis['total_charged_mwh'], 
-                      analysis['total_discharged_mwh'],
-                      analysis['total_losses_mwh']]
+                      analysis['total_discharged_mwh']]
+    if 'total_losses_mwh' in analysis:
+        summary_labels.append('Battery Losses')
+        summary_values.append(analysis['total_losses_mwh'])
     
     ax4.bar(summary_labels, summary_values)
     ax4.set_title('Annual Energy Summary', fontsize=16)
@@ -131,16 +257,49 @@ def visualize_results(results):
     plt.xticks(rotation=45)
     plt.tight_layout()
     
-    # Add summary text
-    summary_text = (
-        f"Battery Cycles: {analysis['battery_cycles']:.2f}\n"
-        f"Overall Efficiency: {analysis['overall_efficiency']*100:.2f}%\n"
-        f"Total Losses: {analysis['total_losses_mwh']:.2f} MWh\n"
-        f"Net Electricity Cost: ${analysis['net_electricity_cost']:.2f}\n"
-        f"Estimated Savings: ${analysis['estimated_savings']:.2f}"
-    )
+    # Add summary text for the statistics that are available
+    summary_lines = []
+    if 'battery_cycles' in analysis:
+        summary_lines.append(f"Battery Cycles: {analysis['battery_cycles']:.2f}")
+    if 'overall_efficiency' in analysis:
+        summary_lines.append(f"Overall Efficiency: {analysis['overall_efficiency']*100:.2f}%")
+    if 'total_losses_mwh' in analysis:
+        summary_lines.append(f"Total Losses: {analysis['total_losses_mwh']:.2f} MWh")
+    if 'net_electricity_cost' in analysis:
+        summary_lines.append(f"Net Electricity Cost: ${analysis['net_electricity_cost']:.2f}")
+    if 'estimated_savings' in analysis:
+        summary_lines.append(f"Estimated Savings: ${analysis['estimated_savings']:.2f}")
+    
+    if summary_lines:
+        plt.figtext(0.7, 0.02, '\n'.join(summary_lines), fontsize=12, 
+                    bbox=dict(facecolor='white', alpha=0.8, boxstyle='round,pad=0.5'))
     
-    plt.figtext(0.7, 0.02, summary_text, fontsize=12, 
-                bbox=dict(facecolor='white', alpha=0.8, boxstyle='round,pad=0.5'))
+    return fig4
+
+
+def visualize_results(results, analysis=None):
+    """
+    Create visualizations of the simulation results
+    For parameter sweeps, use summarize and only the plot functions that are needed
+    
+    Parameters:
+    -----------
+    results : pandas.DataFrame
+        Simulation results as returned by run_simulation
+    analysis : dict or None
+        Additional summary statistics shown in the summary figure, see plot_summary
+            
+    Returns:
+    --------
+    tuple : Figures for the visualizations
+    """
+    summary = summarize(results)
+    if analysis is not None:
+        summary.update(analysis)
+
+    fig1 = plot_power_week(results)
+    fig2 = plot_soc(results)
+    fig3 = plot_monthly(results)
+    fig4 = plot_summary(summary)
     
-    return fig1, fig2, fig3, fig4
\ No newline at end of file
+    return fig1, fig2, fig3, fig4